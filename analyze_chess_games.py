@@ -14,6 +14,34 @@ import os
 import csv
 import re
 import argparse
+import functools
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from rapidfuzz import fuzz, process as fuzz_process, utils as fuzz_utils
+except ImportError:  # optional: only used for ECO codes with no prefix match
+    fuzz_process = None
+
+_MOVENUM_RE = re.compile(rb'(\d+)\.\s')
+_MOVES_TAIL_BYTES = 256
+# Blank (or whitespace-only) line separating the tag section from the movetext
+_TAGS_END_RE = re.compile(rb'\r?\n[ \t]*\r?\n')
+
+# Below this many files, parsing serially beats starting a process pool
+PARALLEL_MIN_FILES = 256
+# Upper bound on files per worker task, which bounds parsed games held in memory
+MAX_CHUNK_FILES = 256
+
+# Result folders written by fetch_chess_games.py
+RESULT_FOLDERS = ("win", "loss", "draw")
+
+# PGN headers copied verbatim into the CSV, after the derived columns
+PGN_HEADER_FIELDS = (
+    "Event", "Site", "Date", "White", "Black", "Result",
+    "WhiteElo", "BlackElo", "TimeControl", "ECO", "Termination", "Link",
+)
+_EMPTY_DEFAULTS = ("",) * len(PGN_HEADER_FIELDS)
 
 # Common ECO code to Opening Name mapping
 ECO_OPENINGS = {
@@ -44,27 +72,55 @@ ECO_OPENINGS = {
     "E60": "King's Indian Defense", "E70": "King's Indian Defense",
 }
 
+# Fallback names for unlisted codes, keyed by ECO prefix (first listed match wins)
+_ECO_BY_PREFIX2 = {}
+_ECO_BY_PREFIX1 = {}
+for _code, _name in ECO_OPENINGS.items():
+    _ECO_BY_PREFIX2.setdefault(_code[:2], _name)
+    _ECO_BY_PREFIX1.setdefault(_code[:1], _name)
+
+# Termination keyword -> label, checked in order
+_TERMINATION_KEYWORDS = (
+    ("checkmate", "Checkmate"),
+    ("resignation", "Resignation"),
+    ("timeout", "Timeout"),
+    ("abandoned", "Abandoned"),
+    ("agreement", "Draw by Agreement"),
+    ("repetition", "Draw by Repetition"),
+    ("stalemate", "Stalemate"),
+    ("insufficient", "Insufficient Material"),
+)
+
 def parse_pgn(filepath):
     """Parses a PGN file and returns headers and move count."""
     headers = {}
-    moves_text = ""
-    in_moves = False
-    
-    with open(filepath, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line.startswith("[") and line.endswith("]"):
-                match = re.match(r'\[(\w+)\s+"(.*)"\]', line)
-                if match:
-                    headers[match.group(1)] = match.group(2)
-            elif line == "":
-                if headers:
-                    in_moves = True
-            elif in_moves:
-                moves_text += " " + line
-    
-    move_numbers = re.findall(r'(\d+)\.\s', moves_text)
-    move_count = int(move_numbers[-1]) if move_numbers else 0
+    
+    with open(filepath, "rb") as f:
+        data = f.read().lstrip()
+    
+    # The tag section ends at the first blank line; everything after is movetext
+    head, *rest = _TAGS_END_RE.split(data, 1)
+    moves = rest[0] if rest else b""
+    
+    for line in head.splitlines():
+        line = line.strip()
+        if line.startswith(b"[") and line.endswith(b"]"):
+            # [Tag "Value"] -- sliced by hand, no regex needed
+            inner = line[1:-1]
+            sp = inner.find(b" ")
+            if sp > 0 and len(inner) > sp + 2 and inner[sp + 1:sp + 2] == b'"' and inner[-1:] == b'"':
+                headers[inner[:sp].decode("utf-8")] = inner[sp + 2:-1].decode("utf-8")
+    
+    # The final move number sits near the end of the movetext, so look there
+    # first; a match at the very start of the tail may be a cut-off number
+    tail_start = max(len(moves) - _MOVES_TAIL_BYTES, 0)
+    last = None
+    for last in _MOVENUM_RE.finditer(moves, tail_start):
+        pass
+    if tail_start and (last is None or last.start() == tail_start):
+        for last in _MOVENUM_RE.finditer(moves):
+            pass
+    move_count = int(last.group(1)) if last else 0
     
     return headers, move_count
 
@@ -76,16 +132,31 @@ def classify_game_length(move_count):
     else:
         return "Long"
 
+@functools.lru_cache(maxsize=None)
 def get_opening_name(eco_code):
+    """Maps an ECO code to an opening name.
+
+    >>> get_opening_name("c50")
+    'Italian Game'
+    >>> get_opening_name("X20")
+    'Unknown'
+    """
+    eco_code = eco_code.strip().upper() if eco_code else ""
     if not eco_code:
         return "Unknown"
-    if eco_code in ECO_OPENINGS:
-        return ECO_OPENINGS[eco_code]
-    for length in [2, 1]:
-        prefix = eco_code[:length]
-        for key, value in ECO_OPENINGS.items():
-            if key.startswith(prefix):
-                return value
+    name = (ECO_OPENINGS.get(eco_code)
+            or _ECO_BY_PREFIX2.get(eco_code[:2])
+            or _ECO_BY_PREFIX1.get(eco_code[:1]))
+    if name:
+        return name
+    if fuzz_process is not None:
+        # Malformed code (e.g. "-B90"): accept only a near-identical listed code
+        match = fuzz_process.extractOne(
+            eco_code, ECO_OPENINGS.keys(),
+            scorer=fuzz.ratio, processor=fuzz_utils.default_process, score_cutoff=80,
+        )
+        if match:
+            return ECO_OPENINGS[match[0]]
     return "Unknown"
 
 def classify_loss_quality(folder, move_count):
@@ -98,106 +169,123 @@ def classify_loss_quality(folder, move_count):
     else:
         return "Well-Fought Loss"
 
+# Termination strings name the winner, so distinct values grow with opponents
+@functools.lru_cache(maxsize=256)
 def classify_termination(termination):
     if not termination:
         return "Unknown"
     term_lower = termination.lower()
-    if "checkmate" in term_lower:
-        return "Checkmate"
-    elif "resignation" in term_lower:
-        return "Resignation"
-    elif "timeout" in term_lower:
-        return "Timeout"
-    elif "abandoned" in term_lower:
-        return "Abandoned"
-    elif "agreement" in term_lower:
-        return "Draw by Agreement"
-    elif "repetition" in term_lower:
-        return "Draw by Repetition"
-    elif "stalemate" in term_lower:
-        return "Stalemate"
-    elif "insufficient" in term_lower:
-        return "Insufficient Material"
+    return next((label for keyword, label in _TERMINATION_KEYWORDS if keyword in term_lower), "Other")
+
+def _parse_pgn_chunk(filepaths):
+    return [parse_pgn(filepath) for filepath in filepaths]
+
+def parse_pgn_files(filepaths):
+    """Yields parse_pgn results in input order, across all cores for large inputs."""
+    # Files are independent, but a process pool only pays off once there are
+    # enough of them to amortize its startup
+    if len(filepaths) < PARALLEL_MIN_FILES:
+        yield from map(parse_pgn, filepaths)
+        return
+    
+    workers = os.cpu_count() or 1
+    chunksize = max(1, min(MAX_CHUNK_FILES, len(filepaths) // (4 * workers)))
+    
+    # Keep at most 2 * workers chunks in flight, refilling as results are
+    # consumed, so parsed games can only get a bounded lead on the CSV writer
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for start in range(0, len(filepaths), chunksize):
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+            pending.append(executor.submit(_parse_pgn_chunk, filepaths[start:start + chunksize]))
+        while pending:
+            yield from pending.popleft().result()
+
+def build_row(file, folder, username_lower, headers, move_count):
+    """Builds one CSV row, in fieldnames order, for a parsed game."""
+    get = headers.get
+    
+    # Determine color played
+    white_user = get("White", "").lower()
+    color_played = "White" if white_user == username_lower else "Black"
+    
+    # Rating differential (0 if either rating is not a plain number, e.g. "?")
+    white_elo = get("WhiteElo", "0")
+    black_elo = get("BlackElo", "0")
+    if white_elo.isdecimal() and black_elo.isdecimal():
+        if color_played == "White":
+            rating_diff = int(black_elo) - int(white_elo)
+        else:
+            rating_diff = int(white_elo) - int(black_elo)
     else:
-        return "Other"
+        rating_diff = 0
+    
+    return (
+        file,
+        folder,
+        color_played,
+        rating_diff,
+        move_count,
+        classify_game_length(move_count),
+        get_opening_name(get("ECO")),
+        classify_loss_quality(folder, move_count),
+        classify_termination(get("Termination")),
+        *map(get, PGN_HEADER_FIELDS, _EMPTY_DEFAULTS),
+    )
 
 def main():
     parser = argparse.ArgumentParser(
         description="Analyze downloaded chess PGN files and generate CSV analytics."
     )
     parser.add_argument("username", help="Your Chess.com username (used for color/rating calculations)")
-    parser.add_argument("--input", default="chess_games", help="Input directory with PGN files (default: chess_games)")
+    parser.add_argument("--input", default="chess_games", help="Input directory with win/loss/draw PGN folders (default: chess_games)")
     parser.add_argument("--output", default="chess_analytics.csv", help="Output CSV file (default: chess_analytics.csv)")
     
     args = parser.parse_args()
     
-    username = args.username
+    username_lower = args.username.lower()
     games_dir = args.input
     output_file = args.output
     
     print(f"Scanning '{games_dir}' for PGN files...")
     
-    games_data = []
-    
-    for root, dirs, files in os.walk(games_dir):
-        for file in files:
-            if file.lower().endswith(".pgn"):
-                filepath = os.path.join(root, file)
-                headers, move_count = parse_pgn(filepath)
-                folder = os.path.basename(root)
-                
-                # Determine color played
-                white_user = headers.get("White", "").lower()
-                color_played = "White" if white_user == username.lower() else "Black"
-                
-                # Rating differential
-                try:
-                    white_elo = int(headers.get("WhiteElo", 0))
-                    black_elo = int(headers.get("BlackElo", 0))
-                    if color_played == "White":
-                        rating_diff = black_elo - white_elo
-                    else:
-                        rating_diff = white_elo - black_elo
-                except ValueError:
-                    rating_diff = 0
-                
-                game = {
-                    "Filename": file,
-                    "Folder": folder,
-                    "ColorPlayed": color_played,
-                    "RatingDiff": rating_diff,
-                    "MoveCount": move_count,
-                    "GameLength": classify_game_length(move_count),
-                    "OpeningName": get_opening_name(headers.get("ECO")),
-                    "LossQuality": classify_loss_quality(folder, move_count),
-                    "TerminationType": classify_termination(headers.get("Termination")),
-                    **{k: headers.get(k, "") for k in [
-                        "Event", "Site", "Date", "White", "Black", "Result",
-                        "WhiteElo", "BlackElo", "TimeControl", "ECO", "Termination", "Link"
-                    ]}
-                }
-                games_data.append(game)
-
-    if not games_data:
+    # Games live one level down in the downloader's win/loss/draw folders
+    pgn_files = []
+    for folder in RESULT_FOLDERS:
+        folder_path = os.path.join(games_dir, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        with os.scandir(folder_path) as entries:
+            for entry in entries:
+                if entry.name.lower().endswith(".pgn") and entry.is_file():
+                    pgn_files.append((folder, entry.name, entry.path))
+    
+    if not pgn_files:
         print("No PGN files found.")
         return
 
-    print(f"Found {len(games_data)} games. Generating CSV...")
+    print(f"Found {len(pgn_files)} games. Generating CSV...")
 
     fieldnames = [
         "Filename", "Folder", "ColorPlayed", "RatingDiff", "MoveCount", "GameLength",
         "OpeningName", "LossQuality", "TerminationType",
-        "Event", "Site", "Date", "White", "Black", "Result",
-        "WhiteElo", "BlackElo", "TimeControl", "ECO", "Termination", "Link"
+        *PGN_HEADER_FIELDS,
     ]
+    filepaths = [path for _, _, path in pgn_files]
+    count = 0
     
+    # Rows are written as games are parsed rather than collected first; only
+    # the file list and a bounded window of parsed chunks stay in memory
     with open(output_file, "w", newline="", encoding="utf-8") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
-        writer.writeheader()
-        for game in games_data:
-            writer.writerow(game)
+        writer = csv.writer(csvfile)
+        writer.writerow(fieldnames)
+        results = parse_pgn_files(filepaths)
+        for (folder, file, _), (headers, move_count) in zip(pgn_files, results):
+            writer.writerow(build_row(file, folder, username_lower, headers, move_count))
+            count += 1
             
-    print(f"\nSuccessfully generated '{output_file}' with {len(games_data)} records.")
+    print(f"\nSuccessfully generated '{output_file}' with {count} records.")
     print("\nColumns included:")
     print("  - ColorPlayed, RatingDiff, MoveCount, GameLength")
     print("  - OpeningName, LossQuality, TerminationType")
@@ -12,8 +12,30 @@ Example:
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import os
 import argparse
+import heapq
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:  # optional: faster decoding of archive responses
+    orjson = None
+
+# Archive months fetched at once; Chess.com may throttle heavier parallel use
+FETCH_WORKERS = 4
+REQUEST_TIMEOUT = 30
+
+# One shared session keeps TCP/TLS connections to api.chess.com alive across calls
+_SESSION = requests.Session()
+_SESSION.headers["User-Agent"] = "ChessGameDownloader/1.0"
+_SESSION.mount("https://", HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS))
+
+# (path, pgn) pairs waiting to be written by the background writer; None stops it
+_WRITE_QUEUE = queue.Queue()
 
 def setup_directories(output_dir):
     for result_type in ["win", "loss", "draw"]:
@@ -21,28 +43,34 @@ def setup_directories(output_dir):
         os.makedirs(path, exist_ok=True)
     print(f"Directories created in {output_dir}")
 
+def parse_json(response):
+    """Decodes a JSON response body, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
 def get_archives(username):
     url = f"https://api.chess.com/pub/player/{username}/games/archives"
     try:
-        response = requests.get(url, headers={"User-Agent": "ChessGameDownloader/1.0"})
+        response = _SESSION.get(url, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
-        return response.json().get("archives", [])
+        return parse_json(response).get("archives", [])
     except Exception as e:
         print(f"Error fetching archives: {e}")
         return []
 
 def get_games_from_archive(archive_url):
     try:
-        response = requests.get(archive_url, headers={"User-Agent": "ChessGameDownloader/1.0"})
+        response = _SESSION.get(archive_url, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
-        return response.json().get("games", [])
+        return parse_json(response).get("games", [])
     except Exception as e:
         print(f"Error fetching games from {archive_url}: {e}")
         return []
 
-def classify_game(game, username):
+def classify_game(game, username_lower):
     white_user = game["white"]["username"].lower()
-    user_color = "white" if white_user == username.lower() else "black"
+    user_color = "white" if white_user == username_lower else "black"
     result = game[user_color]["result"]
     
     if result == "win":
@@ -64,11 +92,32 @@ def save_game(game, classification, output_dir):
     
     pgn = game.get("pgn")
     if pgn:
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(pgn)
+        _WRITE_QUEUE.put((path, pgn))
         return True
     return False
 
+def write_games(failed):
+    """Writes queued games to disk so file I/O overlaps with network fetches.
+
+    Paths that could not be written are appended to failed.
+    """
+    while True:
+        item = _WRITE_QUEUE.get()
+        if item is None:
+            break
+        path, pgn = item
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(pgn)
+        except Exception as e:
+            print(f"Error writing {path}: {e}")
+            failed.append(path)
+            # Don't leave a truncated PGN behind for the analyzer to pick up
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
 def main():
     parser = argparse.ArgumentParser(
         description="Download rapid chess games from Chess.com and organize by result."
@@ -80,6 +129,7 @@ def main():
     args = parser.parse_args()
     
     username = args.username
+    username_lower = username.lower()
     target_count = args.count
     output_dir = args.output
     
@@ -88,29 +138,56 @@ def main():
     setup_directories(output_dir)
     archives = get_archives(username)
     
-    count = 0
-    print(f"Found {len(archives)} archives. Processing...")
+    failed = []
+    writer = threading.Thread(target=write_games, args=(failed,))
+    writer.start()
     
-    for archive_url in reversed(archives):
-        if count >= target_count:
-            break
+    try:
+        count = 0
+        print(f"Found {len(archives)} archives. Processing...")
+    
+        # Fetch newest months first, one batch at a time, so we stop requesting
+        # archives as soon as enough games have been saved
+        archives = archives[::-1]
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            for start in range(0, len(archives), FETCH_WORKERS):
+                if count >= target_count:
+                    break
             
-        print(f"Checking archive: {archive_url}")
-        games = get_games_from_archive(archive_url)
-        
-        games.sort(key=lambda x: x.get("end_time", 0), reverse=True)
-        
-        for game in games:
-            if count >= target_count:
-                break
+                batch = archives[start:start + FETCH_WORKERS]
+                for archive_url, games in zip(batch, executor.map(get_games_from_archive, batch)):
+                    if count >= target_count:
+                        break
+                    
+                    print(f"Checking archive: {archive_url}")
                 
-            if game.get("time_class") == "rapid":
-                classification = classify_game(game, username)
-                if save_game(game, classification, output_dir):
-                    count += 1
-                    print(f"[{count}/{target_count}] Saved {classification}: {game.get('url')}")
+                    rapid_games = [g for g in games if g.get("time_class") == "rapid"]
+                
+                    # Pop newest-first from a heap instead of sorting the whole month;
+                    # only the games actually consumed get ordered (ties keep API order)
+                    newest = [(-g.get("end_time", 0), i) for i, g in enumerate(rapid_games)]
+                    heapq.heapify(newest)
+                
+                    while newest and count < target_count:
+                        game = rapid_games[heapq.heappop(newest)[1]]
+                        classification = classify_game(game, username_lower)
+                        if save_game(game, classification, output_dir):
+                            count += 1
+                            print(f"[{count}/{target_count}] Queued {classification}: {game.get('url')}")
+    
+    finally:
+        # Flush queued writes even if the fetch loop fails or is interrupted
+        _WRITE_QUEUE.put(None)
+        writer.join()
+        # Anything the writer never got to (e.g. it died) was not written
+        while not _WRITE_QUEUE.empty():
+            item = _WRITE_QUEUE.get_nowait()
+            if item is not None:
+                failed.append(item[0])
 
-    print(f"\nDone! Downloaded {count} games to '{output_dir}/'")
+    print(f"\nDone! Downloaded {count - len(failed)} games to '{output_dir}/'")
+    if failed:
+        print(f"Failed to write {len(failed)} games (see errors above)")
 
 if __name__ == "__main__":
     main()